@@ -1,5 +1,5 @@
 import saasops.utils as utils
-from saasops.classes import MessageStyle, SegmentData, SegmentContext, ARRStartDateDecisionTable, ARRMetricsCalculator, ARRTable
+from saasops.classes import MessageStyle, SegmentData, SegmentContext, ARRStartDateDecisionTable, ARRMetricsCalculator, ARRChangeEngine, ARRTable
 from sqlalchemy import text
 from rich.console import Console, Group
 from rich.table import Table
@@ -16,9 +16,6 @@ import numpy as np
 # ARR Calculation Functions
 
 def customer_arr_tbl(date, con, customer=None, contract=None, ignore_zeros=False, tree_detail=False):
-    # Convert the date to a pandas Timestamp
-    date_as_timestamp = pd.to_datetime(date)
-
     # Build the ARR table instance (which now uses a DataFrame)
     arr_table = build_arr_table(con, customer=customer, contract=contract)
 
@@ -26,7 +23,25 @@ def customer_arr_tbl(date, con, customer=None, contract=None, ignore_zeros=False
     # print(f"ARR Table Columns: {arr_table.data.columns}")
     # print(f"ARR Table Data Types: {arr_table.data.dtypes}")
     # print(f"ARR Table Data: {arr_table.data}")
-    
+
+    return customer_arr_tbl_from_table(arr_table, date, ignore_zeros)
+
+
+def customer_arr_tbl_from_table(arr_table, date, ignore_zeros=False):
+    """
+    Sum ARR per customer at a date from an ARR table that has already been built.
+
+    Args:
+        arr_table (ARRTable): ARR table, as returned by build_arr_table
+        date (str or date): Date at which ARR is measured
+        ignore_zeros (bool): Drop customers with zero ARR
+
+    Returns:
+        DataFrame: TotalARR per customer, with a Total row
+    """
+    # Convert the date to a pandas Timestamp
+    date_as_timestamp = pd.to_datetime(date)
+
     active_segments = arr_table.data[(arr_table.data['ARRStartDate'] <= date_as_timestamp) & (arr_table.data['ARREndDate'] >= date_as_timestamp)]
     has_renewal = active_segments['ContractID'].isin(active_segments['RenewalFromContractID'].dropna())
     active_segments = active_segments[~has_renewal]
@@ -47,60 +62,37 @@ def customer_arr_tbl(date, con, customer=None, contract=None, ignore_zeros=False
 
 
 def customer_arr_df(start_date, end_date, con, timeframe='M', ignore_zeros=True):  
-    final_df = pd.DataFrame()
-
+    # Period ends for each month or quarter from start_date to end_date
+    period_ends = []
     current_date = start_date
     while current_date <= end_date:
         period_start, period_end = calculate_timeframe(current_date, timeframe)
-        period_end_timestamp = pd.to_datetime(period_end.strftime('%Y-%m-%d'))
-
-        # Build temp table in database of ARR data
-        arr_table = build_arr_table(con)
-        # print(f"ARR Table: {arr_table.data.shape[0]} rows")
-        # print(f"ARR Table Data: {arr_table.data}")
-        
-        # Filter active segments for the period
-        if not arr_table.data.empty:
-            active_segments = arr_table.data[
-                (arr_table.data['ARRStartDate'] <= period_end_timestamp) &
-                (arr_table.data['ARREndDate'] >= period_end_timestamp)
-            ]
-            has_renewal = active_segments['ContractID'].isin(active_segments['RenewalFromContractID'].dropna())
-            active_segments = active_segments[~has_renewal]
-
-            # print("Period Start:", period_start)
-            # print("Period End:", period_end)
-            # print(active_segments)
-        
-            # Sum ARR per customer for the period
-            if not active_segments.empty:
-                df = active_segments.groupby('CustomerName')['ARR'].sum().reset_index()
-                df.set_index('CustomerName', inplace=True)
-        
-                if ignore_zeros:
-                    df = df[df['ARR'] != 0]
-
-                # Format column name based on the timeframe
-                column_name = format_column_name(period_end, timeframe)
-                df.rename(columns={'ARR': column_name}, inplace=True)
-
-                # Join the dataframes
-                if final_df.empty:
-                    final_df = df
-                else:
-                    final_df = final_df.join(df, how='outer')
-
-            else:
-                # Handle the case where active_segments is empty after filtering
-                if final_df.empty:
-                    # Initialize final_df with the correct column if it's the first iteration
-                    final_df = pd.DataFrame(columns=[format_column_name(period_end, timeframe)])
-                else:
-                    # If final_df is not empty but no active segments in this period, ensure the column is added
-                    final_df[format_column_name(period_end, timeframe)] = 0
-        
+        period_ends.append(period_end)
         current_date = (period_end + pd.Timedelta(days=1)).date()
-    
+
+    # Build the ARR table once and evaluate every customer at every period end
+    arr_table = build_arr_table(con)
+    if arr_table.data.empty:
+        return pd.DataFrame()
+
+    column_names = [format_column_name(period_end, timeframe) for period_end in period_ends]
+    arr_matrix = customer_arr_matrix(arr_table, period_ends)
+    arr_matrix.columns = column_names
+
+    # Periods with any active segment, and customers reported in each period
+    has_active = arr_matrix.notna().any().to_numpy()
+    reported = arr_matrix.notna() & (arr_matrix != 0) if ignore_zeros else arr_matrix.notna()
+
+    # Columns start from the first period that reports a customer
+    reporting_periods = np.flatnonzero(reported.any().to_numpy())
+    if len(reporting_periods) == 0:
+        return pd.DataFrame(columns=[column_names[-1]])
+    first_period = reporting_periods[0]
+
+    # Assemble the customer x period table in one step, zero where a customer has no ARR
+    columns = column_names[first_period:]
+    final_df = arr_matrix.loc[reported[columns].any(axis=1), columns].where(reported[columns])
+    final_df = final_df.astype({col: 'int64' for col, active in zip(column_names, has_active) if col in columns and not active}, errors='ignore')
     final_df.fillna(0, inplace=True)  # Replace NaN with 0
 
     # Add a row that sums ARR per period
@@ -110,6 +102,55 @@ def customer_arr_df(start_date, end_date, con, timeframe='M', ignore_zeros=True)
     return final_df
 
 
+def customer_arr_matrix(arr_table, dates):
+    """
+    Calculate ARR per customer at each of a sorted list of dates in a single pass over the ARR table.
+
+    Each row is active on a contiguous run of the dates, found by binary search on its ARR start
+    and end dates. Rows of contracts renewed by another row active on the same date are excluded,
+    as in customer_arr_tbl.
+
+    Args:
+        arr_table (ARRTable): ARR table, as returned by build_arr_table
+        dates (list): Dates in ascending order
+
+    Returns:
+        DataFrame: ARR with customers as index and one column per date, NaN where a customer has no active segment
+    """
+    df = arr_table.data
+    dates = pd.to_datetime(pd.Series(dates)).to_numpy(dtype='datetime64[ns]')
+    arr_start = df['ARRStartDate'].to_numpy(dtype='datetime64[ns]')
+    arr_end = df['ARREndDate'].to_numpy(dtype='datetime64[ns]')
+
+    # Range of date positions on which each row is active
+    first = np.searchsorted(dates, arr_start, side='left')
+    last = np.searchsorted(dates, arr_end, side='right')
+    counts = np.where(np.isnat(arr_start) | np.isnat(arr_end), 0, np.maximum(last - first, 0))
+
+    # Expand to one entry per (row, date) pair the row is active on
+    rows = np.repeat(np.arange(len(df)), counts)
+    date_positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first, counts)
+
+    # Exclude contracts that a row active on the same date renews from
+    contract_codes, contract_keys = pd.factorize(pd.concat([df['ContractID'], df['RenewalFromContractID']], ignore_index=True))
+    contract_code = contract_codes[:len(df)]
+    renewal_code = contract_codes[len(df):]
+    is_renewing = renewal_code >= 0
+    active_contract_key = contract_code[rows] * len(dates) + date_positions
+    renewed_contract_key = renewal_code[rows] * len(dates) + date_positions
+    superseded = np.isin(active_contract_key, renewed_contract_key[is_renewing[rows]])
+
+    active = pd.DataFrame({
+        'DatePosition': date_positions[~superseded],
+        'CustomerName': df['CustomerName'].to_numpy()[rows[~superseded]],
+        'ARR': df['ARR'].to_numpy(dtype=float)[rows[~superseded]]
+    })
+    arr_by_customer = active.groupby(['CustomerName', 'DatePosition'])['ARR'].sum().unstack('DatePosition')
+    arr_by_customer = arr_by_customer.reindex(columns=range(len(dates)))
+    arr_by_customer.columns = pd.DatetimeIndex(dates)
+    return arr_by_customer
+
+
 def new_arr_by_timeframe(date, con, timeframe="M", ignore_zeros=False):
     start_date, end_date = calculate_timeframe(date, timeframe)
     start_timestamp = pd.to_datetime(start_date)
@@ -150,40 +191,34 @@ def build_arr_change_df(start_date, end_date, con, freq='M', format_type=None, c
     df = pd.DataFrame(index=["Beginning ARR", "New", "Expansion", "Contraction", "Churn", "Ending ARR"], columns=columns)
 
     # Calculate previous ending ARR, this will be used as the beginning ARR for the first period
-    # Have to calculate this before the loop, because it will be used as the beginning ARR for the first period
-    # But it is effectively the execution of the loop but for prior period
-    # use the customer_arr_tbl function to calculate the ARR for the previous period
+    # It is the total ARR on the day before the first period, taken from the same ARR table
     previous_start, previous_end = periods[0]
     previous_end = previous_start - timedelta(days=1)
-    # The customer ARR table has a Total row at the bottom of column TotalARR, so we can use that to get the previous ending ARR
-    previous_ending_arr = customer_arr_tbl(previous_end, con, customer=customer, contract=contract).loc['Total', 'TotalARR']
+    previous_ending_arr = customer_arr_tbl_from_table(arr_table, previous_end).loc['Total', 'TotalARR']
 
     # Set beginning ARR for the first period
     df.at['Beginning ARR', columns[0]] = previous_ending_arr
 
-    carry_forward_churn = []    
+    # Calculate New, Expansion, Contraction and Churn for all periods in a single sweep
+    changes = ARRChangeEngine(arr_table).calculate(periods)
 
     for i, (start, end) in enumerate(periods):
-        arr_calculator = ARRMetricsCalculator(arr_table, start, end)
-
         # Set the beginning ARR for the period
         beginning_arr = previous_ending_arr
-
-        carry_forward_churn = arr_calculator.calculate_arr_changes(carry_forward_churn)
+        new, expansion, contraction, churn = changes.loc[i, ['New', 'Expansion', 'Contraction', 'Churn']]
 
         # Calculate the ending ARR for the period, by adding New + Expansion and subtracting Contraction + Churn
-        calculated_ending_arr = beginning_arr + arr_calculator.metrics['New'] + arr_calculator.metrics['Expansion'] - arr_calculator.metrics['Contraction'] - arr_calculator.metrics['Churn']
+        calculated_ending_arr = beginning_arr + new + expansion - contraction - churn
         
         # Populate the DataFrame for each period
         df.at['Beginning ARR', columns[i]] = beginning_arr
-        df.at['New', columns[i]] = arr_calculator.metrics['New']
-        df.at['Expansion', columns[i]] = arr_calculator.metrics['Expansion']
-        df.at['Contraction', columns[i]] = arr_calculator.metrics['Contraction']
-        df.at['Churn', columns[i]] = arr_calculator.metrics['Churn']
+        df.at['New', columns[i]] = new
+        df.at['Expansion', columns[i]] = expansion
+        df.at['Contraction', columns[i]] = contraction
+        df.at['Churn', columns[i]] = churn
         df.at['Ending ARR', columns[i]] = calculated_ending_arr
 
         previous_ending_arr = calculated_ending_arr
-        arr_calculator.reset_metrics()
 
     return df
 
@@ -215,13 +250,8 @@ def build_arr_table(con, customer=None, contract=None):
     result = con.execute(query)
     rows = result.fetchall()
 
-    arr_table = ARRTable()
-
-    for row in rows:
-        segment_data = SegmentData(*row)
-        context = SegmentContext(segment_data)
-        context.calculate_arr()
-        arr_table.add_row(segment_data, context)
+    # Build the whole table at once rather than concatenating row by row
+    arr_table = ARRTable.from_rows(rows)
 
     arr_table.update_for_renewal_contracts()
 
@@ -1,5 +1,6 @@
 from enum import Enum
 import pandas as pd
+import numpy as np
 import datetime
 import warnings
 
@@ -105,6 +106,106 @@ class ARRCalculationDecisionTable:
         segment_context.arr_end_date = segment_context.segment_data.segment_end_date
             
 
+# Batch condition functions, evaluated as boolean masks over a DataFrame of segments
+
+def has_arr_override_mask(segments):
+    return segments['ARROverrideStartDate'].notna()
+
+def booked_before_segment_start_mask(segments):
+    return segments['ContractDate'] < segments['SegmentStartDate']
+
+def segment_start_before_booked_mask(segments):
+    return segments['SegmentStartDate'] <= segments['ContractDate']
+
+# Batch action functions, returning the candidate ARR start date for every segment
+
+def arr_override_dates(segments):
+    return segments['ARROverrideStartDate']
+
+def booked_dates(segments):
+    return segments['ContractDate']
+
+def segment_start_dates(segments):
+    return segments['SegmentStartDate']
+
+
+class BatchARRStartDateDecisionTable:
+    def __init__(self):
+        self.rules = []
+
+    def add_rule(self, condition, action):
+        self.rules.append((condition, action))
+
+    def evaluate(self, segments):
+        # As with ARRStartDateDecisionTable, the first rule whose condition holds decides the date
+        conditions = [condition(segments).to_numpy(dtype=bool) for condition, _ in self.rules]
+        choices = [action(segments).to_numpy(dtype='datetime64[ns]') for _, action in self.rules]
+        start_dates = np.select(conditions, choices, default=np.datetime64('NaT'))
+        return pd.Series(start_dates, index=segments.index, dtype='datetime64[ns]')
+
+
+class ARRRulesEngine:
+    """
+    Evaluates the ARR start date and ARR calculation rules for a whole DataFrame of segments at once.
+
+    The segments DataFrame uses the column names of the build_arr_table query (see SEGMENT_COLUMNS),
+    with date columns as datetime64 and SegmentValue as float.
+    """
+    
+    def __init__(self):
+        self.arr_start_decision_table = BatchARRStartDateDecisionTable()
+        self.arr_start_decision_table.add_rule(has_arr_override_mask, arr_override_dates)
+        self.arr_start_decision_table.add_rule(booked_before_segment_start_mask, booked_dates)
+        self.arr_start_decision_table.add_rule(segment_start_before_booked_mask, segment_start_dates)
+
+    def evaluate(self, segments):
+        """
+        Calculate ARR start date, ARR end date, ARR and length variance alert for each segment.
+
+        Args:
+            segments (DataFrame): Segments with the SEGMENT_COLUMNS columns
+
+        Returns:
+            DataFrame: ARRStartDate, ARREndDate, ARR and LengthVarianceAlert columns, aligned to segments.index
+        """
+        # Only 'Subscription' segments carry ARR, other types have zero ARR and no ARR dates
+        is_subscription = (segments['Type'] == 'Subscription').to_numpy()
+        arr_start_date = self.arr_start_decision_table.evaluate(segments).where(is_subscription)
+        arr_end_date = segments['SegmentEndDate'].where(is_subscription)
+        has_start = arr_start_date.notna().to_numpy()
+
+        contract_length_months = np.round((segments['SegmentEndDate'] - segments['SegmentStartDate']).dt.days.to_numpy(dtype=float) / 30.42)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            arr = (segments['SegmentValue'].to_numpy(dtype=float) / contract_length_months) * 12
+        arr = np.where(is_subscription, np.where(has_start, arr, np.nan), 0.0)
+        length_variance_alert = has_start & ((contract_length_months % 1) > 0.2)
+
+        return pd.DataFrame({
+            'ARRStartDate': arr_start_date,
+            'ARREndDate': arr_end_date,
+            'ARR': arr,
+            'LengthVarianceAlert': length_variance_alert
+        }, index=segments.index)
+
+
+def segments_to_frame(segments):
+    """
+    Convert SegmentData objects, or rows in SegmentData field order, to a DataFrame for ARRRulesEngine.
+    """
+    rows = [
+        (s.segment_id, s.contract_id, s.renewal_from_contract_id, s.customer_name, s.contract_date,
+         s.segment_start_date, s.segment_end_date, s.arr_override_start_date, s.title, s.type, s.segment_value)
+        if isinstance(s, SegmentData) else tuple(s)
+        for s in segments
+    ]
+    # Keep IDs as Python objects so that missing renewal IDs stay None, as in add_row
+    df = pd.DataFrame(rows, columns=SEGMENT_COLUMNS, dtype=object)
+    for col in ('ContractDate', 'SegmentStartDate', 'SegmentEndDate', 'ARROverrideStartDate'):
+        df[col] = pd.to_datetime(df[col])
+    df['SegmentValue'] = df['SegmentValue'].astype(float)
+    return df
+
+
 class SegmentContext:
     def __init__(self, segment_data):
         self.segment_data = segment_data
@@ -114,24 +215,13 @@ class SegmentContext:
         self.length_variance_alert = False
 
     def calculate_arr(self):
-        # Only proceed if segment type is 'Subscription'
-        if self.segment_data.type == 'Subscription':
-            arr_start_decision_table = ARRStartDateDecisionTable()
-            arr_calculation_table = ARRCalculationDecisionTable()
-
-            arr_start_decision_table.add_rule(has_arr_override, set_arr_to_override)
-            arr_start_decision_table.add_rule(booked_before_segment_start, set_arr_to_booked_date)
-            arr_start_decision_table.add_rule(segment_start_before_booked, set_arr_to_segment_start)
-
-            evaluated_date = arr_start_decision_table.evaluate(self)
-            if evaluated_date:
-                self.arr_start_date = evaluated_date
+        # Evaluate this single segment through the batch rules engine
+        result = arr_rules_engine.evaluate(segments_to_frame([self.segment_data])).iloc[0]
 
-            arr_calculation_table.evaluate(self)
-
-        else:
-            # If not a 'Subscription' type, set ARR to None or 0 as appropriate
-            self.arr = 0  # Or None, depending on how you want to handle non-subscription types
+        self.arr_start_date = None if pd.isna(result['ARRStartDate']) else result['ARRStartDate'].date()
+        self.arr_end_date = None if pd.isna(result['ARREndDate']) else result['ARREndDate'].date()
+        self.arr = None if pd.isna(result['ARR']) else result['ARR']
+        self.length_variance_alert = bool(result['LengthVarianceAlert'])
 
             
 class SegmentData:
@@ -149,32 +239,71 @@ class SegmentData:
         self.segment_value = segment_value
 
 
+# Column order of the build_arr_table query, matching the SegmentData constructor arguments
+SEGMENT_COLUMNS = [
+    "SegmentID", "ContractID", "RenewalFromContractID", "Name", "ContractDate",
+    "SegmentStartDate", "SegmentEndDate", "ARROverrideStartDate", "Title", "Type", "SegmentValue"
+]
+
+arr_rules_engine = ARRRulesEngine()
+
+
+def renewal_transition_columns(arr_data):
+    """
+    Precompute the renewal lookups used by the ARR change classification.
+
+    Args:
+        arr_data (DataFrame): ARRTable data
+
+    Returns:
+        DataFrame: aligned to arr_data.index, with PriorARR (ARR of the first row of the contract
+        renewed from, NaN if none) and NextContractStartDate (earliest ARR start date of any row
+        renewing from the row's contract, NaT if none)
+    """
+    first_arr_by_contract = arr_data.drop_duplicates('ContractID').set_index('ContractID')['ARR']
+    next_start_by_contract = arr_data.groupby('RenewalFromContractID')['ARRStartDate'].min()
+
+    return pd.DataFrame({
+        'PriorARR': arr_data['RenewalFromContractID'].map(first_arr_by_contract).astype(float),
+        'NextContractStartDate': arr_data['ContractID'].map(next_start_by_contract).astype('datetime64[ns]')
+    }, index=arr_data.index)
+
+
 class ARRMetricsCalculator:
-    def __init__(self, arr_table, start_period, end_period):
+    def __init__(self, arr_table, start_period, end_period, renewal_columns=None):
         self.arr_table = arr_table
         self.start_period = start_period
         self.end_period = end_period
         self.metrics = {'New': 0, 'Expansion': 0, 'Contraction': 0, 'Churn': 0}
+        # The renewal lookups only depend on the ARR table, so callers can share them across periods
+        if renewal_columns is None:
+            renewal_columns = renewal_transition_columns(arr_table.data)
+        self.renewal_columns = renewal_columns
 
     def calculate_arr_changes(self, carry_forward_churn=None):
         # Initialize carry_forward_churn if not provided
         if carry_forward_churn is None:
             carry_forward_churn = []
 
-        # Filter data for the current period
         df = self.arr_table.data
-        period_data = df[(df['ARRStartDate'] <= self.end_period) & (df['ARREndDate'] >= self.start_period)]
-
-        # Additionally, consider contracts from the carry_forward_churn list
-        for contract_id in carry_forward_churn:
-            contract_data = df[df['ContractID'] == contract_id]
-            period_data = pd.concat([period_data, contract_data])
-
-        next_period_carry_forward = []
-
-        # print(f"Calculating ARR changes for {len(period_data)} contracts")
-        # print(f"Period start: {self.start_period}, Period end: {self.end_period}")
-        # print(period_data[['ContractID', 'ARRStartDate', 'ARREndDate', 'ARR', 'RenewalFromContractID']])
+        start_period = pd.Timestamp(self.start_period)
+        end_period = pd.Timestamp(self.end_period)
+
+        # Rows are classified in the order the row-by-row version visited them: contracts active
+        # during the period, then every row of each carried-forward contract, once per list entry
+        active_positions = np.flatnonzero(((df['ARRStartDate'] <= end_period) & (df['ARREndDate'] >= start_period)).to_numpy())
+        carried = pd.DataFrame({'ContractID': pd.Series(carry_forward_churn, dtype=object), 'CarryOrder': np.arange(len(carry_forward_churn))})
+        contract_positions = pd.DataFrame({'ContractID': df['ContractID'].to_numpy(), 'Position': np.arange(len(df))})
+        carried_positions = carried.merge(contract_positions, on='ContractID').sort_values(['CarryOrder', 'Position'])['Position'].to_numpy()
+        positions = np.concatenate([active_positions, carried_positions]).astype(np.int64)
+
+        contract_ids = df['ContractID'].iloc[positions].reset_index(drop=True)
+        renewal_ids = df['RenewalFromContractID'].iloc[positions].reset_index(drop=True)
+        arr_start = df['ARRStartDate'].to_numpy()[positions]
+        arr_end = df['ARREndDate'].to_numpy()[positions]
+        arr = df['ARR'].to_numpy(dtype=float)[positions]
+        prior_arr = self.renewal_columns['PriorARR'].to_numpy()[positions]
+        next_contract_start = self.renewal_columns['NextContractStartDate'].to_numpy()[positions]
 
         # So now we have the list of contracts that were active during the period
         # In the sequence, the tests are:
@@ -184,44 +313,159 @@ class ARRMetricsCalculator:
         # If the ARR is lower than the previous ARR, it is a contraction
         # If a contract has an ARREndDate in the period, and there is no renewal, it is churn
 
-        for index, row in period_data.iterrows():
-            # Handle new and renewal contracts
-            if row['ARRStartDate'] >= self.start_period:
-                if not row['RenewalFromContractID']:
-                    self.metrics['New'] += row['ARR']
-                else:
-                    renewed_contract_id = row['RenewalFromContractID']
-                    renewed_contract = df[df['ContractID'] == renewed_contract_id]
-                    if not renewed_contract.empty:
-                        prior_arr = renewed_contract.iloc[0]['ARR']
-                        if row['ARR'] > prior_arr:
-                            self.metrics['Expansion'] += row['ARR'] - prior_arr
-                        elif row['ARR'] < prior_arr:
-                            self.metrics['Contraction'] += prior_arr - row['ARR']
-
-            # Adjusted churn condition to accurately account for renewals
-            if row['ARREndDate'] <= self.end_period:
-                if row['ContractID'] in carry_forward_churn:
-                    # Process previously identified potential churn
-                    self.metrics['Churn'] += row['ARR']
-                    carry_forward_churn.remove(row['ContractID'])
-                else:
-                    # Check for renewals before marking as churn
-                    next_contract_start = df[df['RenewalFromContractID'] == row['ContractID']]['ARRStartDate'].min()
-                    if pd.isnull(next_contract_start) or next_contract_start > row['ARREndDate'] + pd.Timedelta(days=1):
-                        if row['ARREndDate'] == self.end_period:
-                            # Potential churn carried forward if ending on the last day without immediate renewal
-                            next_period_carry_forward.append(row['ContractID'])
-                        else:
-                            # Mark as churn if no immediate renewal and not carried forward
-                            self.metrics['Churn'] += row['ARR']
+        # Handle new and renewal contracts
+        starts_in_period = arr_start >= start_period.to_datetime64()
+        is_new = ~(renewal_ids.notna() & renewal_ids.astype(bool)).to_numpy()
+        is_expansion = starts_in_period & ~is_new & (arr > prior_arr)
+        is_contraction = starts_in_period & ~is_new & (arr < prior_arr)
+
+        self.metrics['New'] = sum(arr[starts_in_period & is_new].tolist(), self.metrics['New'])
+        self.metrics['Expansion'] = sum((arr - prior_arr)[is_expansion].tolist(), self.metrics['Expansion'])
+        self.metrics['Contraction'] = sum((prior_arr - arr)[is_contraction].tolist(), self.metrics['Contraction'])
+
+        # Adjusted churn condition to accurately account for renewals
+        # Each carry-forward entry absorbs one ended row of its contract, in visiting order
+        ends_in_period = arr_end <= end_period.to_datetime64()
+        ended_rank = pd.Series(np.where(ends_in_period, 1, 0)).groupby(contract_ids.to_numpy()).cumsum().to_numpy() - 1
+        carried_counts = contract_ids.map(pd.Series(carry_forward_churn, dtype=object).value_counts()).fillna(0).to_numpy()
+        is_carried_churn = ends_in_period & (ended_rank < carried_counts)
+
+        # Check for renewals before marking as churn
+        no_immediate_renewal = np.isnat(next_contract_start) | (next_contract_start > arr_end + np.timedelta64(1, 'D'))
+        is_potential_churn = ends_in_period & ~is_carried_churn & no_immediate_renewal
+        # Potential churn carried forward if ending on the last day without immediate renewal
+        is_carry_forward = is_potential_churn & (arr_end == end_period.to_datetime64())
+        is_churn = is_carried_churn | (is_potential_churn & ~is_carry_forward)
+
+        self.metrics['Churn'] = sum(arr[is_churn].tolist(), self.metrics['Churn'])
 
         # Return the list of contracts to carry forward for churn calculation in the next period
-        return next_period_carry_forward
+        return contract_ids[is_carry_forward].tolist()
 
     def reset_metrics(self):
         self.metrics = {key: 0 for key in self.metrics}
 
+
+class ARRChangeEngine:
+    """
+    Calculates New, Expansion, Contraction and Churn ARR for a whole sequence of periods in one sweep.
+
+    Each ARR table row contributes at most two dated events, computed once: an ARR start (New, or
+    Expansion/Contraction against the renewed contract's ARR) and an ARR end without an immediate
+    renewal (Churn). Events are bucketed into periods with a binary search over the period starts.
+    A row ending on the last day of a period churns in the following period, as with the
+    carry-forward list of ARRMetricsCalculator.
+    """
+
+    def __init__(self, arr_table, renewal_columns=None):
+        df = arr_table.data
+        if renewal_columns is None:
+            renewal_columns = renewal_transition_columns(df)
+
+        renewal_ids = df['RenewalFromContractID']
+        self.arr_start = df['ARRStartDate'].to_numpy(dtype='datetime64[ns]')
+        self.arr_end = df['ARREndDate'].to_numpy(dtype='datetime64[ns]')
+        self.arr = df['ARR'].to_numpy(dtype=float)
+        self.is_renewal = (renewal_ids.notna() & renewal_ids.astype(bool)).to_numpy()
+        self.prior_arr = renewal_columns['PriorARR'].to_numpy(dtype=float)
+
+        next_contract_start = renewal_columns['NextContractStartDate'].to_numpy(dtype='datetime64[ns]')
+        self.churns = ~np.isnat(self.arr_end) & (np.isnat(next_contract_start) | (next_contract_start > self.arr_end + np.timedelta64(1, 'D')))
+
+    def calculate(self, periods):
+        """
+        Calculate the ARR changes for each period.
+
+        Args:
+            periods (list): Contiguous (start, end) date pairs, as returned by calc.generate_periods
+
+        Returns:
+            DataFrame: New, Expansion, Contraction and Churn columns, one row per period
+        """
+        period_starts = np.array([pd.Timestamp(start) for start, _ in periods], dtype='datetime64[ns]')
+        period_ends = np.array([pd.Timestamp(end) for _, end in periods], dtype='datetime64[ns]')
+        n_periods = len(periods)
+
+        def bucket(dates):
+            # Index of the period containing each date, or -1 when outside all periods
+            index = np.searchsorted(period_starts, dates, side='right') - 1
+            clipped = np.clip(index, 0, n_periods - 1)
+            inside = (index >= 0) & (dates <= period_ends[clipped]) & ~np.isnat(dates)
+            return np.where(inside, index, -1)
+
+        # Start events count in the period of the ARR start, provided the row is still active then
+        start_period = bucket(self.arr_start)
+        starts = start_period >= 0
+        starts[starts] &= self.arr_end[starts] >= period_starts[start_period[starts]]
+
+        is_new = starts & ~self.is_renewal
+        is_expansion = starts & self.is_renewal & (self.arr > self.prior_arr)
+        is_contraction = starts & self.is_renewal & (self.arr < self.prior_arr)
+
+        # End events count in the period of the ARR end, or the next one when ending on the period end
+        end_period = bucket(self.arr_end)
+        ends = self.churns & (end_period >= 0)
+        ends[ends] &= self.arr_start[ends] <= period_ends[end_period[ends]]
+        carried = np.zeros(len(ends), dtype=bool)
+        carried[ends] = self.arr_end[ends] == period_ends[end_period[ends]]
+        churn_period = end_period + carried
+        is_churn = ends & (churn_period < n_periods)
+
+        # Sum in row order, with carried-forward churn after the period's own churn
+        churn_order = np.lexsort((np.flatnonzero(is_churn), carried[is_churn]))
+
+        return pd.DataFrame({
+            'New': np.bincount(start_period[is_new], weights=self.arr[is_new], minlength=n_periods),
+            'Expansion': np.bincount(start_period[is_expansion], weights=(self.arr - self.prior_arr)[is_expansion], minlength=n_periods),
+            'Contraction': np.bincount(start_period[is_contraction], weights=(self.prior_arr - self.arr)[is_contraction], minlength=n_periods),
+            'Churn': np.bincount(churn_period[is_churn][churn_order], weights=self.arr[is_churn][churn_order], minlength=n_periods)
+        })
+
+def renewal_adjusted_arr_end_dates(arr_data):
+    """
+    Calculate ARR end dates after the renewal adjustment, joining renewing rows to the contracts they renew.
+
+    A renewing row whose ARR start date is more than one day after the ARR end date of the renewed
+    contract (taken from that contract's first row) has its ARR end date set to the day before its ARR
+    start date. Rows are considered in table order, so where the renewed contract's first row is itself
+    an earlier renewing row, its adjusted end date is used, as in the original row-by-row update.
+
+    Args:
+        arr_data (DataFrame): ARRTable data
+
+    Returns:
+        Series: ARREndDate column with the adjustment applied, aligned to arr_data.index
+    """
+    original_end_dates = arr_data['ARREndDate'].to_numpy(dtype='datetime64[ns]')
+    start_dates = arr_data['ARRStartDate'].to_numpy(dtype='datetime64[ns]')
+    renewal_ids = arr_data['RenewalFromContractID']
+
+    # Key each contract to the position of its first row, then join renewing rows to it
+    positions = pd.Series(np.arange(len(arr_data)), index=arr_data['ContractID'].to_numpy())
+    first_position_by_contract = positions[~positions.index.duplicated()]
+    is_renewing = renewal_ids.notna().to_numpy() & renewal_ids.astype(bool).to_numpy()
+    renewed_positions = renewal_ids[is_renewing].map(first_position_by_contract)
+    has_renewed_row = renewed_positions.notna().to_numpy()
+
+    renewing_positions = np.flatnonzero(is_renewing)[has_renewed_row]
+    renewed_positions = renewed_positions[has_renewed_row].to_numpy(dtype=np.int64)
+    renewing_starts = start_dates[renewing_positions]
+    renewed_is_earlier = renewed_positions < renewing_positions
+
+    # Resolve chains to a fixed point: each pass settles at least one more level of renewals
+    end_dates = original_end_dates
+    while True:
+        renewed_ends = np.where(renewed_is_earlier, end_dates[renewed_positions], original_end_dates[renewed_positions])
+        gap = renewing_starts >= renewed_ends + np.timedelta64(2, 'D')
+        adjusted_end_dates = original_end_dates.copy()
+        adjusted_end_dates[renewing_positions[gap]] = renewing_starts[gap] - np.timedelta64(1, 'D')
+        if np.array_equal(adjusted_end_dates, end_dates, equal_nan=True):
+            break
+        end_dates = adjusted_end_dates
+
+    return pd.Series(end_dates, index=arr_data.index, name='ARREndDate')
+
+
 class ARRTable:
     def __init__(self):
         # Define the dtypes for your DataFrame columns
@@ -237,6 +481,52 @@ class ARRTable:
         # Initialize self.data as an empty DataFrame with these dtypes
         self.data = pd.DataFrame({col: pd.Series(dtype=typ) for col, typ in dtypes.items()})
 
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build an ARRTable in a single allocation from the rows of the Segments/Contracts/Customers join.
+
+        Args:
+            rows (list): Rows in SegmentData field order, as returned by the build_arr_table query
+
+        Returns:
+            ARRTable: Table with the same content and dtypes as repeated add_row calls would produce
+        """
+        if not rows:
+            return cls()
+        return cls.from_segments(segments_to_frame(rows))
+
+    @classmethod
+    def from_segments(cls, segments):
+        """
+        Build an ARRTable from a DataFrame of segments, evaluating the ARR rules over all rows in one pass.
+
+        Args:
+            segments (DataFrame): Segments with the SEGMENT_COLUMNS columns
+
+        Returns:
+            ARRTable: Table with the same content and dtypes as repeated add_row calls would produce
+        """
+        arr_table = cls()
+        if segments.empty:
+            return arr_table
+
+        arr = arr_rules_engine.evaluate(segments)
+        columns = {
+            "SegmentID": segments['SegmentID'],
+            "ContractID": segments['ContractID'],
+            "RenewalFromContractID": segments['RenewalFromContractID'],
+            "CustomerName": segments['Name'],
+            "ARRStartDate": arr['ARRStartDate'],
+            "ARREndDate": arr['ARREndDate'],
+            "ARR": arr['ARR']
+        }
+
+        # Build each column once with the dtype declared in __init__
+        dtypes = arr_table.data.dtypes
+        arr_table.data = pd.DataFrame({col: values.astype(dtypes[col]) for col, values in columns.items()}).reset_index(drop=True)
+        return arr_table
+
     def add_row(self, segment_data, context):
         new_row = {
             "SegmentID": segment_data.segment_id, 
@@ -260,18 +550,4 @@ class ARRTable:
         self.data.loc[self.data['SegmentID'] == segment_id, 'ARREndDate'] = pd.to_datetime(new_arr_end_date)
         
     def update_for_renewal_contracts(self):
-        # Iterate over each row in the DataFrame
-        for index, row in self.data.iterrows():
-            if row['RenewalFromContractID']:
-                renewing_segment_id = row['SegmentID']
-                # Find the corresponding row for the renewal
-                renewing_rows = self.data[self.data['SegmentID'] == renewing_segment_id]
-                if not renewing_rows.empty:
-                    renewing_arr_start_date = renewing_rows.iloc[0]['ARRStartDate']
-                    # Find the corresponding renewed contract's end date
-                    renewed_rows = self.data[self.data['ContractID'] == row['RenewalFromContractID']]
-                    if not renewed_rows.empty:
-                        renewed_arr_end_date = renewed_rows.iloc[0]['ARREndDate']
-                        if (renewing_arr_start_date - renewed_arr_end_date).days > 1:
-                            new_arr_end_date = renewing_arr_start_date - pd.Timedelta(days=1)
-                            self.data.loc[index, 'ARREndDate'] = new_arr_end_date
+        self.data['ARREndDate'] = renewal_adjusted_arr_end_dates(self.data)
@@ -1,9 +1,10 @@
 import pytest
 from sqlalchemy import create_engine
+import duckdb
 import random
 import string
-from src.utils import print_status
-from src import classes
+from saasops.utils import print_status
+from saasops import classes
 from sqlalchemy.sql import text
 from rich.console import Console
 
@@ -69,6 +70,27 @@ def populate_sample_data_case4(engine):
     with engine.begin() as connection:
         connection.execute(text(sql_stmts))
         
+def create_test_duckdb():
+    con = duckdb.connect()
+    with open('data/create_tables.sql') as f:
+        con.execute(f.read())
+    # The sample data scripts rely on generated IDs, so back each primary key with a sequence
+    id_columns = {
+        "Customers": "CustomerID",
+        "Contracts": "ContractID",
+        "Segments": "SegmentID",
+        "Invoices": "InvoiceID",
+        "InvoiceSegments": "InvoiceSegmentID"
+    }
+    for table_name, id_column in id_columns.items():
+        con.execute(f"CREATE SEQUENCE seq_{table_name.lower()} START 1")
+        con.execute(f"ALTER TABLE {table_name} ALTER COLUMN {id_column} SET DEFAULT nextval('seq_{table_name.lower()}')")
+    return con
+
+def populate_duckdb_sample_data(con, case):
+    with open(f'tests/sample_data_case{case}.sql') as f:
+        con.execute(f.read())
+
 @pytest.fixture(scope="function")
 def base_db_engine():
     db_name = create_test_db()
@@ -99,3 +121,31 @@ def db_engine_case3(base_db_engine):
 def db_engine_case4(base_db_engine):
     populate_sample_data_case4(base_db_engine)
     yield base_db_engine
+
+@pytest.fixture
+def duckdb_con_case1():
+    con = create_test_duckdb()
+    populate_duckdb_sample_data(con, 1)
+    yield con
+    con.close()
+
+@pytest.fixture
+def duckdb_con_case2():
+    con = create_test_duckdb()
+    populate_duckdb_sample_data(con, 2)
+    yield con
+    con.close()
+
+@pytest.fixture
+def duckdb_con_case3():
+    con = create_test_duckdb()
+    populate_duckdb_sample_data(con, 3)
+    yield con
+    con.close()
+
+@pytest.fixture
+def duckdb_con_case4():
+    con = create_test_duckdb()
+    populate_duckdb_sample_data(con, 4)
+    yield con
+    con.close()
@@ -0,0 +1,38 @@
+import pytest
+from saasops.classes import ARRRulesEngine, SegmentData, SegmentContext, segments_to_frame
+from datetime import date
+import pandas as pd
+
+# Rows in SegmentData field order: override, booked before start, start before booked, non-subscription
+SEGMENT_ROWS = [
+    (1, 1, None, 'Customer A', date(2022, 5, 1), date(2022, 6, 1), date(2023, 5, 31), date(2022, 7, 1), 'Override', 'Subscription', 120000.0),
+    (2, 2, None, 'Customer B', date(2022, 5, 1), date(2022, 6, 1), date(2023, 5, 31), None, 'Booked early', 'Subscription', 120000.0),
+    (3, 3, 2, 'Customer B', date(2023, 6, 15), date(2023, 6, 1), date(2024, 5, 31), None, 'Booked late', 'Subscription', 60000.0),
+    (4, 4, None, 'Customer C', date(2022, 5, 1), date(2022, 6, 1), date(2022, 8, 31), None, 'Setup', 'Services', 15000.0)
+]
+
+def test_arr_rules_engine_start_dates():
+    result_df = ARRRulesEngine().evaluate(segments_to_frame(SEGMENT_ROWS))
+
+    expected_start_dates = pd.Series(pd.to_datetime(['2022-07-01', '2022-05-01', '2023-06-01', None]), name='ARRStartDate')
+    pd.testing.assert_series_equal(result_df['ARRStartDate'], expected_start_dates)
+
+def test_arr_rules_engine_arr_values():
+    result_df = ARRRulesEngine().evaluate(segments_to_frame(SEGMENT_ROWS))
+
+    assert result_df['ARR'].tolist() == [120000.0, 120000.0, 60000.0, 0.0]
+    assert pd.isna(result_df.loc[3, 'ARREndDate'])
+    assert not result_df['LengthVarianceAlert'].any()
+
+@pytest.mark.parametrize("row, expected_start_date, expected_arr", [
+    (SEGMENT_ROWS[0], date(2022, 7, 1), 120000.0),
+    (SEGMENT_ROWS[1], date(2022, 5, 1), 120000.0),
+    (SEGMENT_ROWS[2], date(2023, 6, 1), 60000.0),
+    (SEGMENT_ROWS[3], None, 0.0)
+])
+def test_segment_context_calculate_arr(row, expected_start_date, expected_arr):
+    context = SegmentContext(SegmentData(*row))
+    context.calculate_arr()
+
+    assert context.arr_start_date == expected_start_date
+    assert context.arr == expected_arr
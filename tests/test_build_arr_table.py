@@ -0,0 +1,64 @@
+import pytest
+from saasops.calc import build_arr_table
+from saasops.classes import ARRTable, SegmentData, SegmentContext, renewal_adjusted_arr_end_dates
+import pandas as pd
+
+SEGMENT_QUERY = """
+SELECT s.SegmentID, s.ContractID, c.RenewalFromContractID, cu.Name, c.ContractDate,
+       s.SegmentStartDate, s.SegmentEndDate, s.ARROverrideStartDate,
+       s.Title, s.Type, s.SegmentValue
+FROM Segments s
+JOIN Contracts c ON s.ContractID = c.ContractID
+JOIN Customers cu ON c.CustomerID = cu.CustomerID
+"""
+
+def build_arr_table_by_row(rows):
+    arr_table = ARRTable()
+    for row in rows:
+        segment_data = SegmentData(*row)
+        context = SegmentContext(segment_data)
+        context.calculate_arr()
+        arr_table.add_row(segment_data, context)
+    return arr_table
+
+def test_build_arr_table_case1(duckdb_con_case1):
+    # Contract booked 2022-05-01 ahead of a 12-month segment starting 2022-06-01, so ARR starts on the booking date
+    result_df = build_arr_table(duckdb_con_case1).data
+
+    assert len(result_df) == 1
+    assert result_df.loc[0, 'ARRStartDate'] == pd.Timestamp('2022-05-01')
+    assert result_df.loc[0, 'ARREndDate'] == pd.Timestamp('2023-05-31')
+    assert result_df.loc[0, 'ARR'] == 120000.0
+
+@pytest.mark.parametrize("case", [1, 2, 3, 4])
+def test_from_rows_matches_add_row(case, request):
+    con = request.getfixturevalue(f"duckdb_con_case{case}")
+    rows = con.execute(SEGMENT_QUERY).fetchall()
+
+    expected_df = build_arr_table_by_row(rows).data
+    result_df = ARRTable.from_rows(rows).data
+
+    pd.testing.assert_frame_equal(result_df, expected_df)
+
+def test_from_rows_empty():
+    result_df = ARRTable.from_rows([]).data
+
+    assert result_df.empty
+    assert result_df.dtypes.equals(ARRTable().data.dtypes)
+
+def test_renewal_adjusted_arr_end_dates():
+    # Contract 2 renews contract 1 without a gap, contract 3 renews contract 2 two weeks after it ends
+    arr_data = pd.DataFrame({
+        "SegmentID": [1, 2, 3],
+        "ContractID": [1, 2, 3],
+        "RenewalFromContractID": [None, 1, 2],
+        "CustomerName": ["Test Customer"] * 3,
+        "ARRStartDate": pd.to_datetime(["2022-06-01", "2023-06-01", "2024-06-15"]),
+        "ARREndDate": pd.to_datetime(["2023-05-31", "2024-05-31", "2025-05-31"]),
+        "ARR": [120000.0, 120000.0, 120000.0]
+    })
+
+    result = renewal_adjusted_arr_end_dates(arr_data)
+
+    expected = pd.Series(pd.to_datetime(["2023-05-31", "2024-05-31", "2024-06-14"]), name="ARREndDate")
+    pd.testing.assert_series_equal(result, expected)